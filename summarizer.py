@@ -9,13 +9,59 @@ Medical AI/NLP Report Summarizer
 
 import sqlite3
 import re
+import os
+import time
+import mmap
 import json
-from datetime import datetime
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional
-
-
-@dataclass
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from multiprocessing import get_context
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import List, Dict, Iterator, Optional
+
+# Opt in to google-re2 (linear-time matching) with MEDSUMM_USE_RE2=1
+re2 = None
+if os.environ.get('MEDSUMM_USE_RE2') == '1':
+    try:
+        import re2
+    except ImportError:
+        pass
+
+
+def _compile(pattern: str):
+    """Compile with RE2 when enabled and installed, otherwise with re"""
+    if re2 is not None:
+        return re2.compile(pattern)
+    return re.compile(pattern)
+
+
+# Precompiled extraction patterns; flags are inline so both engines agree
+_PATIENT_RE = _compile(r'(?i)(?:patient\s+id|mrn|id)[:\s]+([A-Za-z0-9\-]+)')
+_DATE_RE = _compile(r'(?i)(?:date)[:\s]+(\d{1,2}/\d{1,2}/\d{4})')
+_MED_DOSE_RE = _compile(r'\b([a-z]+)\s+\d+\s*mg')  # matched on lowered text
+# Lab name -> (extraction pattern, SQLite column type in the reports table)
+_LABS = {
+    'glucose': (r'(?i)glucose[:\s]+(\d+(?:\.\d+)?)', 'REAL'),
+    'hemoglobin': (r'(?i)hemoglobin[:\s]+(\d+(?:\.\d+)?)', 'REAL'),
+    'cholesterol': (r'(?i)cholesterol[:\s]+(\d+(?:\.\d+)?)', 'REAL'),
+    'blood_pressure': (r'(?i)(?:bp|blood pressure)[:\s]+(\d+/\d+)', 'TEXT'),
+    'temperature': (r'(?i)temp(?:erature)?[:\s]+(\d+(?:\.\d+)?)', 'REAL')
+}
+_LAB_RES = {name: _compile(pattern) for name, (pattern, _) in _LABS.items()}
+_LAB_COLUMNS = {name: sql_type for name, (_, sql_type) in _LABS.items()}
+_DIAG_RES = [
+    _compile(r'(?is)' + pattern)
+    for pattern in (
+        r'diagnosis[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)',
+        r'impression[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)',
+        r'assessment[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)'
+    )
+]
+_WS_RE = re.compile(r'\s+')
+
+
+@dataclass(slots=True)
 class MedicalReport:
     """Data class to represent a medical report"""
     patient_id: str
@@ -29,115 +75,87 @@ class MedicalReport:
     raw_text: str
 
 
-class MedicalSummarizer:
-    """Lightweight medical report summarizer using only standard library"""
+class ReportParser:
+    """Extracts structured fields from medical report text"""
 
-    def __init__(self, db_path: str = "medical_reports.db"):
-        self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
-        self.setup_database()
+    def __init__(self):
+        self._today_cache = None
+        self._today_expires = 0.0
 
         # Medical keywords for extraction
-        self.symptoms = [
+        self.symptoms = (
             'fever', 'headache', 'nausea', 'vomiting', 'diarrhea', 'fatigue',
             'chest pain', 'shortness of breath', 'dizziness', 'cough', 'rash',
             'abdominal pain', 'back pain', 'joint pain', 'muscle pain'
-        ]
+        )
 
-        self.common_meds = [
+        self.common_meds = (
             'acetaminophen', 'ibuprofen', 'aspirin', 'lisinopril', 'metformin',
             'atorvastatin', 'amlodipine', 'omeprazole', 'losartan', 'gabapentin'
-        ]
-
-    def setup_database(self):
-        """Create database schema"""
-        cursor = self.conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reports (
-                id INTEGER PRIMARY KEY,
-                patient_id TEXT,
-                report_date TEXT,
-                report_type TEXT,
-                diagnosis TEXT,
-                symptoms TEXT,
-                medications TEXT,
-                lab_values TEXT,
-                summary TEXT,
-                raw_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        )
 
-        self.conn.commit()
+    def _today(self) -> str:
+        """Today's date as YYYY-MM-DD, cached until local midnight"""
+        now = time.time()
+        if now >= self._today_expires:
+            today = datetime.fromtimestamp(now)
+            midnight = (today + timedelta(days=1)).replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            self._today_cache = today.strftime('%Y-%m-%d')
+            self._today_expires = midnight.timestamp()
+        return self._today_cache
 
     # Note: This function was constructed with the assistance of AI tools
     def extract_patient_info(self, text: str) -> tuple:
         """Extract patient ID and date"""
         # Patient ID patterns
-        patient_match = re.search(
-            r'(?:patient\s+id|mrn|id)[:\s]+([A-Za-z0-9\-]+)',
-            text, re.IGNORECASE)
+        patient_match = _PATIENT_RE.search(text)
         patient_id = patient_match.group(1) if patient_match else "UNKNOWN"
 
         # Date patterns
-        date_match = re.search(r'(?:date)[:\s]+(\d{1,2}/\d{1,2}/\d{4})',
-                               text, re.IGNORECASE)
+        date_match = _DATE_RE.search(text)
         if date_match:
             try:
                 date_obj = datetime.strptime(date_match.group(1), '%m/%d/%Y')
                 report_date = date_obj.strftime('%Y-%m-%d')
             except:
-                report_date = datetime.now().strftime('%Y-%m-%d')
+                report_date = self._today()
         else:
-            report_date = datetime.now().strftime('%Y-%m-%d')
+            report_date = self._today()
 
         return patient_id, report_date
 
-    def extract_symptoms(self, text: str) -> List[str]:
-        """Find symptoms in text"""
-        found_symptoms = []
-        text_lower = text.lower()
-
-        for symptom in self.symptoms:
-            if symptom in text_lower:
-                found_symptoms.append(symptom)
+    def extract_symptoms(self, text: str,
+                         text_lower: Optional[str] = None) -> List[str]:
+        """Find symptoms in text; pass text_lower to reuse a lowered copy"""
+        if text_lower is None:
+            text_lower = text.lower()
 
-        return found_symptoms
+        return [symptom for symptom in self.symptoms
+                if symptom in text_lower]
 
-    def extract_medications(self, text: str) -> List[str]:
-        """Find medications in text"""
-        found_meds = []
-        text_lower = text.lower()
+    def extract_medications(self, text: str,
+                            text_lower: Optional[str] = None) -> List[str]:
+        """Find medications in text; pass text_lower to reuse a lowered copy"""
+        if text_lower is None:
+            text_lower = text.lower()
 
-        # Look for common medications
-        for med in self.common_meds:
-            if med in text_lower:
-                found_meds.append(med)
+        # Look for common medications; dict keys act as an ordered set
+        found_meds = dict.fromkeys(
+            med for med in self.common_meds if med in text_lower)
 
         # Look for medication patterns (drug names with dosages)
-        med_patterns = re.findall(r'([A-Za-z]+)\s+\d+\s*mg', text,
-                                  re.IGNORECASE)
-        for med in med_patterns:
-            if med.lower() not in found_meds:
-                found_meds.append(med.lower())
+        for match in _MED_DOSE_RE.finditer(text_lower):
+            found_meds.setdefault(match.group(1), None)
 
-        return found_meds
+        return list(found_meds)
 
     def extract_lab_values(self, text: str) -> Dict[str, str]:
         """Extract lab values"""
         labs = {}
 
-        patterns = {
-            'glucose': r'glucose[:\s]+(\d+(?:\.\d+)?)',
-            'hemoglobin': r'hemoglobin[:\s]+(\d+(?:\.\d+)?)',
-            'cholesterol': r'cholesterol[:\s]+(\d+(?:\.\d+)?)',
-            'blood_pressure': r'(?:bp|blood pressure)[:\s]+(\d+/\d+)',
-            'temperature': r'temp(?:erature)?[:\s]+(\d+(?:\.\d+)?)'
-        }
-
-        for lab_name, pattern in patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
+        for lab_name, pattern in _LAB_RES.items():
+            match = pattern.search(text)
             if match:
                 labs[lab_name] = match.group(1)
 
@@ -145,17 +163,11 @@ class MedicalSummarizer:
 
     def extract_diagnosis(self, text: str) -> str:
         """Extract diagnosis"""
-        patterns = [
-            r'diagnosis[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)',
-            r'impression[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)',
-            r'assessment[:\s]+(.*?)(?:\n\n|\n[A-Z]|$)'
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+        for pattern in _DIAG_RES:
+            match = pattern.search(text)
             if match:
                 diagnosis = match.group(1).strip()
-                return re.sub(r'\s+', ' ', diagnosis)[:200]
+                return _WS_RE.sub(' ', diagnosis)[:200]
 
         return "No clear diagnosis found"
 
@@ -187,9 +199,10 @@ class MedicalSummarizer:
     def process_report(self, text: str,
                        report_type: str = "General") -> MedicalReport:
         """Process medical report text"""
+        text_lower = text.lower()
         patient_id, report_date = self.extract_patient_info(text)
-        symptoms = self.extract_symptoms(text)
-        medications = self.extract_medications(text)
+        symptoms = self.extract_symptoms(text, text_lower)
+        medications = self.extract_medications(text, text_lower)
         lab_values = self.extract_lab_values(text)
         diagnosis = self.extract_diagnosis(text)
 
@@ -208,16 +221,136 @@ class MedicalSummarizer:
         report.summary = self.generate_summary(report)
         return report
 
-    def save_report(self, report: MedicalReport) -> int:
-        """Save report to database"""
+
+class MedicalSummarizer(ReportParser):
+    """Lightweight medical report summarizer using only standard library"""
+
+    def __init__(self, db_path: str = "medical_reports.db"):
+        super().__init__()
+        self.db_path = db_path
+        # Larger statement cache so repeated queries skip re-planning
+        self.conn = sqlite3.connect(db_path, cached_statements=256)
+        self.conn.execute('PRAGMA cache_size = -20000')  # ~20 MB pages
+        self.setup_database()
+
+    def setup_database(self):
+        """Create database schema"""
         cursor = self.conn.cursor()
 
+        # WAL with relaxed sync keeps bulk inserts from fsyncing per commit
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY,
+                patient_id TEXT,
+                report_date TEXT,
+                report_type TEXT,
+                diagnosis TEXT,
+                symptoms TEXT,
+                medications TEXT,
+                lab_values TEXT,
+                summary TEXT,
+                raw_text TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                {', '.join(f'{name} {sql_type}'
+                           for name, sql_type in _LAB_COLUMNS.items())}
+            )
+        ''')
+
+        # Typed copies of the labs for SQL filtering; lab_values keeps the
+        # extracted strings. Older databases get the columns backfilled.
+        cursor.execute('PRAGMA table_info(reports)')
+        columns = {row[1] for row in cursor.fetchall()}
+        for name, sql_type in _LAB_COLUMNS.items():
+            if name not in columns:
+                cursor.execute(
+                    f'ALTER TABLE reports ADD COLUMN {name} {sql_type}')
+                cursor.execute(
+                    f"UPDATE reports SET {name} = "
+                    f"json_extract(lab_values, '$.{name}') "
+                    f"WHERE lab_values IS NOT NULL")
+
         cursor.execute('''
-            INSERT INTO reports 
-            (patient_id, report_date, report_type, diagnosis, symptoms, 
-             medications, lab_values, summary, raw_text)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+            CREATE INDEX IF NOT EXISTS idx_reports_patient
+            ON reports(patient_id, report_date DESC)
+        ''')
+
+        self.has_fts = self._setup_fts(cursor)
+
+        self.conn.commit()
+
+    @staticmethod
+    def _setup_fts(cursor) -> bool:
+        """Create the full-text search index, if SQLite supports it
+
+        Trigrams keep LIKE's substring matching. Returns False when FTS5 or
+        the trigram tokenizer (SQLite 3.34+) is unavailable.
+        """
+        # Without the triggers the index is stale and must be rebuilt
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' "
+            "AND name = 'reports_fts_insert'")
+        needs_rebuild = cursor.fetchone() is None
+
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+                    raw_text, diagnosis,
+                    content='reports', content_rowid='id', tokenize='trigram'
+                )
+            ''')
+            # A table made by a newer SQLite may not load on this one
+            cursor.execute('SELECT rowid FROM reports_fts LIMIT 0')
+            cursor.executescript('''
+                CREATE TRIGGER IF NOT EXISTS reports_fts_insert
+                AFTER INSERT ON reports BEGIN
+                    INSERT INTO reports_fts (rowid, raw_text, diagnosis)
+                    VALUES (new.id, new.raw_text, new.diagnosis);
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS reports_fts_delete
+                AFTER DELETE ON reports BEGIN
+                    INSERT INTO reports_fts (reports_fts, rowid, raw_text, diagnosis)
+                    VALUES ('delete', old.id, old.raw_text, old.diagnosis);
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS reports_fts_update
+                AFTER UPDATE ON reports BEGIN
+                    INSERT INTO reports_fts (reports_fts, rowid, raw_text, diagnosis)
+                    VALUES ('delete', old.id, old.raw_text, old.diagnosis);
+                    INSERT INTO reports_fts (rowid, raw_text, diagnosis)
+                    VALUES (new.id, new.raw_text, new.diagnosis);
+                END;
+            ''')
+
+            # Index reports saved while the table or its triggers were absent
+            if needs_rebuild:
+                cursor.execute(
+                    "INSERT INTO reports_fts (reports_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError:
+            # Leftover triggers would make every write fail
+            cursor.executescript('''
+                DROP TRIGGER IF EXISTS reports_fts_insert;
+                DROP TRIGGER IF EXISTS reports_fts_delete;
+                DROP TRIGGER IF EXISTS reports_fts_update;
+            ''')
+            return False
+
+    _INSERT_SQL = f'''
+        INSERT INTO reports
+        (patient_id, report_date, report_type, diagnosis, symptoms,
+         medications, lab_values, summary, raw_text,
+         {', '.join(_LAB_COLUMNS)})
+        VALUES ({', '.join('?' * (9 + len(_LAB_COLUMNS)))})
+    '''
+
+    @staticmethod
+    def _report_row(report: MedicalReport) -> tuple:
+        """Convert a report into an INSERT parameter tuple"""
+        return (
             report.patient_id,
             report.report_date,
             report.report_type,
@@ -226,23 +359,37 @@ class MedicalSummarizer:
             json.dumps(report.medications),
             json.dumps(report.lab_values),
             report.summary,
-            report.raw_text
-        ))
+            report.raw_text,
+            *(report.lab_values.get(name) for name in _LAB_COLUMNS)
+        )
+
+    def save_report(self, report: MedicalReport) -> int:
+        """Save report to database"""
+        cursor = self.conn.execute(self._INSERT_SQL, self._report_row(report))
 
         self.conn.commit()
         return cursor.lastrowid
 
-    def get_patient_reports(self, patient_id: str) -> List[Dict]:
-        """Get all reports for a patient"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM reports WHERE patient_id = ? 
-            ORDER BY report_date DESC
-        ''', (patient_id,))
-
-        reports = []
-        for row in cursor.fetchall():
-            report_dict = {
+    def save_reports(self, reports: List[MedicalReport]) -> int:
+        """Save many reports in a single transaction"""
+        with self.conn:
+            cursor = self.conn.executemany(
+                self._INSERT_SQL, [self._report_row(r) for r in reports])
+        return cursor.rowcount
+
+    _PATIENT_REPORTS_SQL = '''
+        SELECT id, patient_id, report_date, report_type, diagnosis,
+               symptoms, medications, lab_values, summary
+        FROM reports WHERE patient_id = ?
+        ORDER BY report_date DESC
+    '''
+
+    def get_patient_reports(self, patient_id: str) -> Iterator[Dict]:
+        """Yield all reports for a patient, newest first"""
+        cursor = self.conn.execute(self._PATIENT_REPORTS_SQL, (patient_id,))
+
+        for row in cursor:
+            yield {
                 'id': row[0],
                 'patient_id': row[1],
                 'report_date': row[2],
@@ -253,19 +400,26 @@ class MedicalSummarizer:
                 'lab_values': json.loads(row[7]) if row[7] else {},
                 'summary': row[8]
             }
-            reports.append(report_dict)
-
-        return reports
 
     def search_reports(self, query: str) -> List[Dict]:
         """Search reports by keyword"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, patient_id, report_date, summary 
-            FROM reports 
-            WHERE raw_text LIKE ? OR diagnosis LIKE ?
-            ORDER BY report_date DESC
-        ''', (f'%{query}%', f'%{query}%'))
+        if self.has_fts and len(query) >= 3:
+            # Quoted as a single phrase so FTS5 operators are taken literally
+            phrase = '"' + query.replace('"', '""') + '"'
+            cursor = self.conn.execute('''
+                SELECT r.id, r.patient_id, r.report_date, r.summary
+                FROM reports_fts f JOIN reports r ON r.id = f.rowid
+                WHERE reports_fts MATCH ?
+                ORDER BY r.report_date DESC
+            ''', (phrase,))
+        else:
+            # No FTS5, or too short for the trigram index
+            cursor = self.conn.execute('''
+                SELECT id, patient_id, report_date, summary
+                FROM reports
+                WHERE raw_text LIKE ? OR diagnosis LIKE ?
+                ORDER BY report_date DESC
+            ''', (f'%{query}%', f'%{query}%'))
 
         return [
             {'id': row[0], 'patient_id': row[1], 'date': row[2],
@@ -275,17 +429,15 @@ class MedicalSummarizer:
 
     def get_stats(self) -> Dict:
         """Get database statistics"""
-        cursor = self.conn.cursor()
-
-        cursor.execute('SELECT COUNT(*) FROM reports')
-        total_reports = cursor.fetchone()[0]
+        total_reports = self.conn.execute(
+            'SELECT COUNT(*) FROM reports').fetchone()[0]
 
-        cursor.execute('SELECT COUNT(DISTINCT patient_id) FROM reports')
-        unique_patients = cursor.fetchone()[0]
+        unique_patients = self.conn.execute(
+            'SELECT COUNT(DISTINCT patient_id) FROM reports').fetchone()[0]
 
-        cursor.execute(
-            'SELECT report_type, COUNT(*) FROM reports GROUP BY report_type')
-        report_types = dict(cursor.fetchall())
+        report_types = dict(self.conn.execute(
+            'SELECT report_type, COUNT(*) FROM reports GROUP BY report_type'
+        ).fetchall())
 
         return {
             'total_reports': total_reports,
@@ -297,35 +449,79 @@ class MedicalSummarizer:
         """Close database connection"""
         self.conn.close()
 
+def _split_reports(data) -> Iterator[str]:
+    """Yield reports from bytes or an mmap, decoding one at a time"""
+    start = 0
+    while start <= len(data):
+        end = data.find(b"---", start)
+        if end == -1:
+            end = len(data)
+        text = data[start:end].decode("utf-8")
+        # Normalize newlines as text mode would
+        text = text.replace("\r\n", "\n").replace("\r", "\n").strip()
+        if text:
+            yield text
+        start = end + 3
+
+
+def iter_reports_from_file(filepath: str) -> Iterator[str]:
+    """Yield reports from a file one at a time, separated by ---"""
+    with open(filepath, "rb") as f:
+        try:
+            # Map the file so only the current report is decoded
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files, pipes and other non-regular files can't be mapped
+            yield from _split_reports(f.read())
+            return
+
+        with mm:
+            yield from _split_reports(mm)
+
+
 def load_reports_from_file(filepath: str) -> list[str]:
     """Load multiple reports from a file, separated by ---"""
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-    return [r.strip() for r in content.split("---") if r.strip()]
+    return list(iter_reports_from_file(filepath))
 
 
-# Example usage
-def demo():
-    """Demo the summarizer with sample data"""
+# Parser used by worker processes; it holds no database connection
+_worker_parser = ReportParser()
 
-    # Load reports from file
-    reports = load_reports_from_file("reports.txt")
 
-    summarizer = MedicalSummarizer("demo_reports.db")
+def _parse_report(text: str, report_type: str) -> MedicalReport:
+    """Process one report in a worker process"""
+    return _worker_parser.process_report(text, report_type)
 
-    try:
-        for text in reports:
-            report = summarizer.process_report(text, "Imported")
-            report_id = summarizer.save_report(report)
-            print(f" Report saved with ID: {report_id}")
-            print(f"Summary: {report.summary}\n")
-
-        # Show stats
-        stats = summarizer.get_stats()
-        print(f"Database Stats: {stats}")
-
-    finally:
-        summarizer.close()
+
+# Example usage
+def demo(batch_size: int = 100, workers: Optional[int] = None):
+    """Demo the summarizer with sample data"""
+
+    # Start the pool before opening the database; spawned workers never
+    # inherit the SQLite connection
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=get_context("spawn")) as executor:
+        summarizer = MedicalSummarizer("demo_reports.db")
+
+        try:
+            # Stream reports from file, parse each batch across worker
+            # processes and save it in one transaction from this process
+            texts = iter_reports_from_file("reports.txt")
+            saved = 0
+            while batch := list(islice(texts, batch_size)):
+                reports = list(executor.map(
+                    _parse_report, batch, repeat("Imported"), chunksize=32))
+                for report in reports:
+                    print(f"Summary: {report.summary}\n")
+                saved += summarizer.save_reports(reports)
+            print(f" Saved {saved} reports")
+
+            # Show stats
+            stats = summarizer.get_stats()
+            print(f"Database Stats: {stats}")
+
+        finally:
+            summarizer.close()
 
 
 